@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .lotto_core import LottoFetcher, PatternAnalyzer, LottoGenerator
 import os
+import threading
 
 app = FastAPI()
 
@@ -17,12 +18,27 @@ app.add_middleware(
 # Initialize Engine
 # Note: In serverless, global state might reset, but that's okay for this Logic
 fetcher = LottoFetcher()
-# Attempt quick update (timeout protected in core)
-fetcher.update_history(200)
+analyzer = None
+generator = None
+built_rounds = -1  # History size the current engine was built from
 
-analyzer = PatternAnalyzer(fetcher.get_last_n_rounds(200))
-analyzer.calibrate()
-generator = LottoGenerator(analyzer)
+def build_engine():
+    global analyzer, generator, built_rounds
+    rounds = len(fetcher.history)
+    new_analyzer = PatternAnalyzer(fetcher.get_last_n_rounds(200))
+    new_analyzer.calibrate()
+    analyzer, generator = new_analyzer, LottoGenerator(new_analyzer)
+    built_rounds = rounds
+
+def refresh_engine():
+    # Network fetch (timeout protected in core); rebuild only if history grew
+    fetcher.update_history(200)
+    if len(fetcher.history) != built_rounds:
+        build_engine()
+
+# Serve from the local history right away, fetch new rounds off the request path
+build_engine()
+threading.Thread(target=refresh_engine, daemon=True).start()
 
 @app.get("/api")
 def read_root():
@@ -30,15 +46,11 @@ def read_root():
 
 @app.get("/api/generate")
 def generate_numbers():
-    results = []
-    for _ in range(5):
-        nums, score, details = generator.generate()
-        results.append({
-            "numbers": nums,
-            "resonance_score": round(score, 1),
-            "details": details
-        })
-    results.sort(key=lambda x: x['resonance_score'], reverse=True)
+    results = [{
+        "numbers": nums,
+        "resonance_score": round(score, 1),
+        "details": details
+    } for nums, score, details in generator.generate_batch(5)]
     return {"status": "success", "data": results}
 
 @app.get("/api/stats")
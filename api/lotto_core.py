@@ -1,43 +1,138 @@
 import json
-import urllib.request
-import urllib.error
+import urllib3
 import time
 import statistics
 import random
 import os
+import bisect
+import heapq
 from collections import Counter
-from typing import List, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Callable
+
+try:
+    import orjson
+except ImportError:  # Fall back to stdlib json if the wheel is missing
+    orjson = None
 
 # --- Constants ---
 API_URL = "https://www.dhlottery.co.kr/common.do?method=getLottoNumber&drwNo={}"
 # Vercel-specific: Use /tmp for writable, but prefer bundled file for reading if /tmp is missing
 WRITABLE_DATA_FILE = "/tmp/lotto_history.json" 
 BUNDLED_DATA_FILE = os.path.join(os.path.dirname(__file__), "lotto_history.json")
+# Calibrated weights, keyed by the latest round they were computed from;
+# bump CALIBRATION_VERSION whenever calibrate() logic changes
+WEIGHTS_FILE = "/tmp/lotto_weights.json"
+CALIBRATION_VERSION = 1
+# Only the weights calibrate() computes are cached; the rest stay as configured
+CALIBRATED_KEYS = ('missing_zone', 'sum_range', 'odd_even')
+
+# Shared keep-alive pool so concurrent probes reuse the TCP/TLS connection.
+# Never retry a failed request (one attempt per probe), but follow redirects like urlopen did
+HTTP_POOL = urllib3.PoolManager(
+    num_pools=1, maxsize=4, timeout=3.0,
+    retries=urllib3.Retry(total=None, connect=0, read=0, other=0, status=0, redirect=3),
+    headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+)
 
 # Primes in 1-45
 PRIMES = {2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43}
 # OMR "Dead Zones" (Edges & Center - approximate)
 OMR_DEAD_ZONES = {1, 7, 8, 14, 15, 21, 22, 28, 29, 35, 36, 42, 43, 4, 38} 
 
+# Bitmask views (bit n set <=> number n drawn); a ticket fits in one int
+ZONE_MASKS = tuple(
+    sum(1 << i for i in range(lo, hi + 1))
+    for lo, hi in ((1, 10), (11, 20), (21, 30), (31, 40), (41, 45))
+)
+ODD_MASK = sum(1 << i for i in range(1, 46, 2))
+DEAD_MASK = sum(1 << d for d in OMR_DEAD_ZONES)
+
+# Candidates scored per generate() call (kept small for serverless speed);
+# generation stops early once a pick clears GOOD_ENOUGH_SCORE
+TRIALS = 50
+GOOD_ENOUGH_SCORE = 85.0
+
+# Template for candidate draws; copied per draw, never shuffled in place
+_NUMBER_POOL = tuple(range(1, 46))
+
+def mask_to_nums(mask: int) -> List[int]:
+    """Unpacks a ticket bitmask into its sorted numbers."""
+    nums = []
+    while mask:
+        low = mask & -mask
+        nums.append(low.bit_length() - 1)
+        mask ^= low
+    return nums
+
+def json_loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode('utf-8'))
+
+def json_dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+# Rule checks on a ticket bitmask
+def check_missing_zone(mask: int) -> bool:
+    return any((mask & z) == 0 for z in ZONE_MASKS)
+
+def check_sum(mask: int) -> bool:
+    return 120 <= sum(mask_to_nums(mask)) <= 160
+
+def check_odd_even(mask: int) -> bool:
+    return 2 <= (mask & ODD_MASK).bit_count() <= 4
+
+def check_dead_zone(mask: int) -> bool:
+    return (mask & DEAD_MASK).bit_count() <= 2
+
+# Rules Table (order shared by score_mask() and LottoGenerator.rules)
+RULE_FNS = (check_missing_zone, check_sum, check_odd_even, check_dead_zone)
+RULE_NAMES = ("Missing Zone", "Sum Range", "Odd/Even", "Dead Zone")
+
+def score_mask(mask: int, rules: Tuple[Tuple[int, Callable[[int], bool], float], ...], max_score: float,
+               best_score: float = -1.0) -> Tuple[float, Tuple[bool, ...]]:
+    """Scores a ticket bitmask; returns the resonance score and per-rule pass flags.
+
+    `rules` holds (index, check, points) sorted by descending points. Scoring
+    stops with -1.0 as soon as the candidate can no longer beat `best_score`.
+    """
+    passed = [False] * len(RULE_FNS)
+    score = 0.0
+    remaining = max_score
+    for idx, func, pts in rules:
+        remaining -= pts
+        if func(mask):
+            score += pts
+            passed[idx] = True
+        elif max_score > 0 and (score + remaining) / max_score * 100 <= best_score:
+            return -1.0, tuple(passed)
+    final_score = (score / max_score) * 100 if max_score > 0 else 0
+    return final_score, tuple(passed)
+
 class LottoFetcher:
     """Fetches and manages Lotto 6/45 data from the official source."""
     
     def __init__(self):
         self.history = self._load_data()
+        self.dirty = False  # True once update_history adds rounds not yet on disk
+        self._sorted_keys = sorted(int(k) for k in self.history.keys())
         
     def _load_data(self) -> Dict[str, Any]:
         # Priority 1: Check /tmp (most recent if persisted slightly)
         if os.path.exists(WRITABLE_DATA_FILE):
             try:
-                with open(WRITABLE_DATA_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(WRITABLE_DATA_FILE, 'rb') as f:
+                    return json_loads(f.read())
             except: pass
             
         # Priority 2: Check bundled file
         if os.path.exists(BUNDLED_DATA_FILE):
             try:
-                with open(BUNDLED_DATA_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(BUNDLED_DATA_FILE, 'rb') as f:
+                    return json_loads(f.read())
             except: pass
             
         return {}
@@ -45,16 +140,12 @@ class LottoFetcher:
     def _fetch_round(self, round_no: int) -> Dict[str, Any]:
         """Fetches a single round's data with headers."""
         url = API_URL.format(round_no)
-        req = urllib.request.Request(
-            url, 
-            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        )
         try:
-            with urllib.request.urlopen(req, timeout=3) as response:
-                if response.status == 200:
-                    data = json.loads(response.read().decode('utf-8'))
-                    if data.get("returnValue") == "success":
-                        return data
+            response = HTTP_POOL.request('GET', url)
+            if response.status == 200:
+                data = json_loads(response.data)
+                if data.get("returnValue") == "success":
+                    return data
         except Exception as e:
             print(f"Failed to fetch round {round_no}: {e}")
         return None
@@ -62,36 +153,42 @@ class LottoFetcher:
     def update_history(self, target_count: int = 200):
         # In Serverless, we might not want to do deep updates every request.
         # But we can try to fetch just the latest if missing.
-        current_max = 0
-        if self.history:
-            current_max = max(int(k) for k in self.history.keys())
+        current_max = self._sorted_keys[-1] if self._sorted_keys else 0
         
         # Simple update: Try to get next 1-2 rounds only to avoid timeout
         start_probe = max(current_max, 1100) 
         latest_round = start_probe
         
-        # Try to fetch forward a bit
-        for probe in range(start_probe + 1, start_probe + 3):
-            if str(probe) in self.history:
-                continue
-            data = self._fetch_round(probe)
+        # Try to fetch forward a bit (probes are independent, so fetch them concurrently)
+        probes = [p for p in range(start_probe + 1, start_probe + 3) if str(p) not in self.history]
+        results = []
+        if probes:
+            with ThreadPoolExecutor(max_workers=len(probes)) as ex:
+                results = list(ex.map(self._fetch_round, probes))
+        
+        # Keep rounds in order and stop at the first miss
+        for probe, data in zip(probes, results):
             if data:
                 self.history[str(probe)] = data
+                bisect.insort(self._sorted_keys, probe)
+                self.dirty = True
             else:
                 break
             
         self._save_data()
 
     def _save_data(self):
+        if not self.dirty:
+            return
         try:
-            with open(WRITABLE_DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.history, f, ensure_ascii=False, indent=2)
+            with open(WRITABLE_DATA_FILE, 'wb') as f:
+                f.write(json_dumps(self.history))
+            self.dirty = False
         except:
             pass # /tmp might not be available or other issue
 
     def get_last_n_rounds(self, n: int = 200) -> List[Dict[str, Any]]:
-        sorted_keys = sorted([int(k) for k in self.history.keys()], reverse=True)
-        return [self.history[str(k)] for k in sorted_keys[:n]]
+        return [self.history[str(k)] for k in reversed(self._sorted_keys[-n:])] if n > 0 else []
 
 class PatternAnalyzer:
     """Analyzes history to establish rule weights."""
@@ -107,76 +204,94 @@ class PatternAnalyzer:
     def calibrate(self):
         if not self.history:
             return
+        latest_round = max(d.get('drwNo', 0) for d in self.history)
+        if self._load_weights(latest_round):
+            return
             
         # Quick simple calibration to avoid heavy compute on serverless
         # (Ideally this should be pre-computed, but we'll do a fast pass)
         self.weights['missing_zone'] = 0.8
         self.weights['sum_range'] = 0.7
         self.weights['odd_even'] = 0.6
+        self._save_weights(latest_round)
 
-    def _get_nums(self, draw):
-        return [draw[f'drwtNo{i}'] for i in range(1, 7)]
+    def _load_weights(self, latest_round: int) -> bool:
+        # Reuse weights persisted by an earlier run of the same calibration on the same history
+        if not os.path.exists(WEIGHTS_FILE):
+            return False
+        try:
+            with open(WEIGHTS_FILE, 'rb') as f:
+                cached = json_loads(f.read())
+            if cached.get('v') == CALIBRATION_VERSION and cached.get('max') == latest_round:
+                self.weights.update((k, cached['w'][k]) for k in CALIBRATED_KEYS)
+                return True
+        except: pass
+        return False
+
+    def _save_weights(self, latest_round: int):
+        try:
+            with open(WEIGHTS_FILE, 'wb') as f:
+                calibrated = {k: self.weights[k] for k in CALIBRATED_KEYS}
+                f.write(json_dumps({'v': CALIBRATION_VERSION, 'max': latest_round, 'w': calibrated}))
+        except:
+            pass # /tmp might not be available or other issue
 
 class LottoGenerator:
     """Generates numbers using Weighted Pattern Resonance."""
     
     def __init__(self, analyzer: PatternAnalyzer):
         self.analyzer = analyzer
-        self.history_nums = [analyzer._get_nums(d) for d in analyzer.history]
-        self.last_round_nums = set(self.history_nums[0]) if self.history_nums else set()
+        weights = (
+            analyzer.weights['missing_zone'], analyzer.weights['sum_range'], 0.6,
+            analyzer.weights['dead_zone']
+        )
+        points = tuple(10.0 * w for w in weights)
+        self.max_score = sum(points)
+        # Heaviest rules first so hopeless candidates are pruned early
+        self.rules = tuple(sorted(
+            zip(range(len(RULE_FNS)), RULE_FNS, points), key=lambda r: r[2], reverse=True
+        ))
         
     def generate(self) -> Tuple[List[int], float, Dict[str, bool]]:
-        best_candidate = None
-        best_score = -1.0
-        best_details = {}
+        return self.generate_batch(1, TRIALS)[0]
+
+    def generate_batch(self, k: int = 5, trials: int = TRIALS * 5) -> List[Tuple[List[int], float, Dict[str, bool]]]:
+        """Scores one shared pool of candidates and returns the top-k, best first."""
+        if k <= 0:
+            return []
+        rules, max_score = self.rules, self.max_score
+        top = []  # min-heap of (score, candidate, passed); top[0] is the k-th best
+        seen = set()  # A repeated draw scores the same, so only score it once
         
-        for _ in range(50): # Reduced iterations for serverless speed
-            candidate = sorted(random.sample(range(1, 46), 6))
-            score, details = self._calculate_resonance(candidate)
+        for _ in range(trials):
+            candidate = self._sample_mask()
+            if candidate in seen:
+                continue
+            seen.add(candidate)
+            floor = top[0][0] if len(top) == k else -1.0
+            score, passed = score_mask(candidate, rules, max_score, floor)
             
-            if score > best_score:
-                best_score = score
-                best_candidate = candidate
-                best_details = details
-                
-            if score > 85.0:
+            if score > floor:
+                if len(top) < k:
+                    heapq.heappush(top, (score, candidate, passed))
+                else:
+                    heapq.heapreplace(top, (score, candidate, passed))
+                    
+            if len(top) == k and top[0][0] > GOOD_ENOUGH_SCORE:
                 break
                 
-        return best_candidate, best_score, best_details
-
-    def _calculate_resonance(self, nums: List[int]) -> Tuple[float, Dict[str, bool]]:
-        score = 0.0
-        max_score = 0.0
-        details = {}
-        
-        # Simplified rules for speed
-        def check_missing_zone(n):
-            zones = [
-                any(1 <= x <= 10 for x in n), any(11 <= x <= 20 for x in n),
-                any(21 <= x <= 30 for x in n), any(31 <= x <= 40 for x in n),
-                any(41 <= x <= 45 for x in n)
-            ]
-            return not all(zones)
-            
-        def check_sum(n): return 120 <= sum(n) <= 160
-        def check_odd_even(n):
-            odd = len([x for x in n if x % 2 != 0])
-            return odd in (3, 2, 4)
-            
-        # Rules Table
-        rules = [
-            ("Missing Zone", self.analyzer.weights['missing_zone'], check_missing_zone),
-            ("Sum Range", self.analyzer.weights['sum_range'], check_sum),
-            ("Odd/Even", 0.6, check_odd_even),
+        return [
+            (mask_to_nums(candidate), score, dict(zip(RULE_NAMES, passed)))
+            for score, candidate, passed in sorted(top, reverse=True)
         ]
-        
-        for name, weight, func in rules:
-            passed = func(nums)
-            points = 10.0 * weight
-            max_score += points
-            if passed:
-                score += points
-            details[name] = passed
-            
-        final_score = (score / max_score) * 100 if max_score > 0 else 0
-        return final_score, details
+
+    def _sample_mask(self, rnd=random.random) -> int:
+        # Partial Fisher-Yates over a fresh copy of the 1-45 pool (concurrent
+        # requests must not shuffle the same list)
+        pool = list(_NUMBER_POOL)
+        mask = 0
+        for i in range(6):
+            j = i + int(rnd() * (45 - i))
+            pool[i], pool[j] = pool[j], pool[i]
+            mask |= 1 << pool[i]
+        return mask